@@ -1,3 +1,4 @@
+from .alias_index import AliasIndex
 from .ref import Ref
 from .registerable import Registerable, Serializable
-from .registry import Registry, SerializableRegistry
+from .registry import Registry, SerializableRegistry, TranscodingRegistry
@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+import re
+import tempfile
+from typing import Optional
+
+
+def is_hex_digest(hash_str: str) -> bool:
+    return re.match(r'\A[0-9a-f]{3,}\Z', hash_str) is not None
+
+
+class AliasIndex:
+    """Persistent mapping from one hash to another, stored as a directory of small files.
+
+    Objects in CAS are immutable, so an index of aliases has to live outside of it. Each
+    alias is kept in its own file, sharded like `HashFS`, so that lookups cost the same
+    however many aliases there are. Writes go to a temporary file that is renamed into
+    place, so concurrent readers never observe a partially written alias, and concurrent
+    writers of different aliases never lose each other's entries.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def _alias_path(self, hash_str: str) -> Path:
+        return self.path / hash_str[:2] / hash_str[2:]
+
+    def get(self, hash_str: str) -> Optional[str]:
+        if not is_hex_digest(hash_str):
+            # Only hex digests can have been aliased
+            return None
+        try:
+            return self._alias_path(hash_str).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    def set(self, hash_str: str, alias: str) -> None:
+        for h in (hash_str, alias):
+            if not is_hex_digest(h):
+                raise ValueError(f'Not a hash: {h}')
+        alias_path = self._alias_path(hash_str)
+        alias_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, mode='w') as f:
+                f.write(alias)
+            os.replace(tmp_path, alias_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
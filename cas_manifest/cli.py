@@ -0,0 +1,284 @@
+"""Command-line tool for operating on an S3HashFS: warming caches, syncing to s3, verifying
+local objects.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Set, TextIO, Tuple
+
+import boto3
+from hashfs import HashFS
+from hashfs.hashfs import Stream
+
+from .reserved_dirs import object_files
+from .s3_hashfs import S3HashFS, S3CasInfo, get_extension
+
+logger = logging.getLogger(__name__)
+
+MAX_MANIFEST_SIZE = 1024 * 1024
+
+
+class Progress:
+    """Thread-safe counter of completed items and bytes, reported to a stream at most once
+    every `interval` seconds. On a terminal the report is redrawn in place, otherwise each
+    report is a new line, so the default interval is longer to keep logs readable.
+    """
+
+    def __init__(self, label: str, total: Optional[int] = None, out: TextIO = sys.stderr,
+                 interval: Optional[float] = None):
+        self.label = label
+        self.total = total
+        self.out = out
+        self.is_tty = out.isatty()
+        if interval is None:
+            interval = 0.5 if self.is_tty else 30.0
+        self.interval = interval
+        self.count = 0
+        self.nbytes = 0
+        self.start = time.monotonic()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def update(self, nbytes: int = 0) -> None:
+        with self._lock:
+            self.count += 1
+            self.nbytes += nbytes
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            summary = self.summary()
+        self._write(summary, final=False)
+
+    def _write(self, summary: str, final: bool) -> None:
+        if self.is_tty:
+            self.out.write(f'\r{summary}' + ('\n' if final else ''))
+        else:
+            self.out.write(f'{summary}\n')
+        self.out.flush()
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        total_str = '' if self.total is None else f'/{self.total}'
+        mb = self.nbytes / 1e6
+        return (f'{self.label}: {self.count}{total_str} objects, {mb:.1f} MB '
+                f'in {elapsed:.1f}s ({self.count / elapsed:.1f} obj/s, {mb / elapsed:.1f} MB/s)')
+
+    def finish(self) -> None:
+        with self._lock:
+            summary = self.summary()
+        self._write(summary, final=True)
+
+
+def find_refs(path: str, max_size: int = MAX_MANIFEST_SIZE) -> Set[str]:
+    """Return the hashes of all `Ref`s in the manifest stored at `path`.
+    Files that are not json manifests have no refs. Manifests are small, so files larger
+    than `max_size` are assumed to be data and are not parsed.
+    """
+    if os.path.getsize(path) > max_size:
+        return set()
+    with open(path, mode='rb') as f:
+        if f.read(1) != b'{':
+            return set()
+        f.seek(0)
+        try:
+            contents = json.load(f)
+        except ValueError:
+            return set()
+    if not isinstance(contents, dict) or 'class' not in contents:
+        return set()
+    refs: Set[str] = set()
+    _collect_refs(contents.get('value'), refs)
+    return refs
+
+
+def _collect_refs(value, refs: Set[str]) -> None:
+    if isinstance(value, dict):
+        # A serialized Ref is a dict with a single `hash_str` field
+        if set(value.keys()) == {'hash_str'} and isinstance(value['hash_str'], str):
+            refs.add(value['hash_str'])
+        else:
+            for v in value.values():
+                _collect_refs(v, refs)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_refs(v, refs)
+
+
+def _run_parallel(fn: Callable, items: Iterable, parallelism: int) -> Tuple[List, List]:
+    """Apply `fn` to each of `items` on a thread pool. An exception only fails its own item,
+    so that one bad object does not abort a bulk run.
+    Returns the results of the successful items, and the items that failed.
+    """
+    results = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {executor.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f'Failed on {futures[future]}: {e!r}')
+                failed.append(futures[future])
+    return results, failed
+
+
+def warm(fs: S3HashFS, hashes: List[str], parallelism: int) -> Tuple[List[str], List[str]]:
+    """Fetch `hashes` and every object they reference into the local cache.
+    Returns the hashes that could not be found, and those that failed to download.
+    """
+    progress = Progress('warm')
+    seen: Set[str] = set()
+    missing: List[str] = []
+    failed: List[str] = []
+
+    def fetch(hash_str: str) -> Set[str]:
+        addr = fs.get(hash_str)
+        if addr is None:
+            missing.append(hash_str)
+            return set()
+        progress.update(os.path.getsize(addr.abspath))
+        return find_refs(addr.abspath)
+
+    frontier = set(hashes)
+    while frontier:
+        seen |= frontier
+        children, failed_frontier = _run_parallel(fetch, frontier, parallelism)
+        failed.extend(failed_frontier)
+        frontier = set().union(*children) - seen
+    progress.finish()
+    return missing, failed
+
+
+def sync(fs: S3HashFS, parallelism: int) -> Tuple[int, List[str]]:
+    """Upload every locally cached object that is missing from s3.
+    Returns the number of objects uploaded, and the hashes that failed to upload.
+    """
+    paths = list(fs.files())
+    progress = Progress('sync', total=len(paths))
+
+    def push(path: str) -> bool:
+        uploaded = fs.push(fs.unshard(path), extension=get_extension(path))
+        progress.update(os.path.getsize(path) if uploaded else 0)
+        return uploaded
+
+    uploaded, failed = _run_parallel(push, paths, parallelism)
+    progress.finish()
+    return sum(uploaded), [fs.unshard(path) for path in failed]
+
+
+def verify(fs: HashFS, parallelism: int,
+           remove: bool = False) -> Tuple[List[str], List[str]]:
+    """Re-hash every locally cached object, and return the paths whose contents do not
+    match their hash, and those that could not be checked. If `remove` is set, mismatched
+    files are deleted so that they will be fetched again on next access.
+    """
+    paths = list(object_files(fs))
+    progress = Progress('verify', total=len(paths))
+
+    def check(path: str) -> Optional[str]:
+        stream = Stream(path)
+        with closing(stream):
+            actual = fs.computehash(stream)
+        progress.update(os.path.getsize(path))
+        if actual == fs.unshard(path):
+            return None
+        if remove:
+            os.remove(path)
+        return path
+
+    results, failed = _run_parallel(check, paths, parallelism)
+    progress.finish()
+    return [path for path in results if path is not None], failed
+
+
+def _read_lines(f: TextIO) -> List[str]:
+    return [line.strip() for line in f if line.strip()]
+
+
+def _read_hashes(args) -> List[str]:
+    hashes = list(args.hashes)
+    if args.hash_file is not None:
+        if args.hash_file == '-':
+            hashes.extend(_read_lines(sys.stdin))
+        else:
+            with open(args.hash_file) as f:
+                hashes.extend(_read_lines(f))
+    return hashes
+
+
+def _positive_int(value: str) -> int:
+    parsed = int(value)
+    if parsed < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1: {value}')
+    return parsed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cas-manifest', description=__doc__)
+    parser.add_argument('--local-path', type=Path, required=True,
+                        help='Directory of the local cache')
+    parser.add_argument('--bucket', help='S3 bucket of the remote store')
+    parser.add_argument('--prefix', default='cas', help='Key prefix in the s3 bucket')
+    parser.add_argument('-j', '--parallelism', type=_positive_int, default=8,
+                        help='Number of objects to process concurrently')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    warm_parser = subparsers.add_parser(
+        'warm', help='Fetch root hashes and everything they reference into the local cache')
+    warm_parser.add_argument('hashes', nargs='*', help='Root hashes to fetch')
+    warm_parser.add_argument('--hash-file', help='File of root hashes, one per line (- for stdin)')
+
+    subparsers.add_parser('sync', help='Upload local objects that are missing from s3')
+
+    verify_parser = subparsers.add_parser(
+        'verify', help='Re-hash local objects and report those that do not match')
+    verify_parser.add_argument('--remove', action='store_true',
+                               help='Delete mismatched objects from the local cache')
+    return parser
+
+
+def _report_failures(failed: List[str]) -> None:
+    for item in failed:
+        print(f'Failed: {item}', file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'verify':
+        local_fs = HashFS(args.local_path, depth=1, width=2)
+        mismatches, failed = verify(local_fs, args.parallelism, remove=args.remove)
+        for path in mismatches:
+            print(path)
+        _report_failures(failed)
+        return 1 if mismatches or failed else 0
+
+    if args.bucket is None:
+        print(f'--bucket is required for {args.command}', file=sys.stderr)
+        return 2
+    fs = S3HashFS(args.local_path, boto3.client('s3'), S3CasInfo(args.bucket, args.prefix))
+
+    if args.command == 'warm':
+        missing, failed = warm(fs, _read_hashes(args), args.parallelism)
+        for hash_str in missing:
+            print(f'Not found: {hash_str}', file=sys.stderr)
+        _report_failures(failed)
+        return 1 if missing or failed else 0
+    else:
+        uploaded, failed = sync(fs, args.parallelism)
+        print(f'Uploaded {uploaded} objects', file=sys.stderr)
+        _report_failures(failed)
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
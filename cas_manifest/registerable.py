@@ -56,3 +56,16 @@ class Serializable(Generic[Deserialized], Registerable, ABC):
         :type inst: Deserialized
         """
         pass
+
+    @classmethod
+    def equals(cls, inst: Deserialized, other: Deserialized) -> bool:
+        """Return whether two Deserialized instances hold the same data. Used to check that
+        re-packing an object in this format is lossless; override this for types whose `==`
+        does not return a single bool.
+
+        :param inst: Whatever is deserialized and used by the application
+        :type inst: Deserialized
+        :param other: Another instance to compare against
+        :type other: Deserialized
+        """
+        return bool(inst == other)
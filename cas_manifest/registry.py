@@ -1,13 +1,17 @@
 import contextlib
 import json
+import logging
 
 from hashfs import HashFS
 from pydantic.dataclasses import dataclass
 
-from typing import List, Type, TypeVar, Generic, Generator
+from typing import List, Tuple, Type, TypeVar, Generic, Generator
 
+from .alias_index import AliasIndex
 from .registerable import Registerable, Serializable
 
+logger = logging.getLogger(__name__)
+
 T = TypeVar('T', bound=Registerable)
 
 
@@ -50,3 +54,62 @@ class SerializableRegistry(Generic[DeserializedBase], Registry[Serializable[Dese
             yield deserialized
         finally:
             serialized.close(deserialized)
+
+
+@dataclass(config=ArbitraryTypeConfig)
+class TranscodingRegistry(SerializableRegistry[DeserializedBase]):
+    """SerializableRegistry that migrates objects to a preferred format as they are read.
+
+    When an object stored in any other format is opened, it is re-packed with
+    `preferred_class` and the new hash is recorded in `alias_index`. Subsequent opens
+    of the original hash load the re-packed object instead. Objects are only aliased if
+    `preferred_class.equals` confirms that the re-packed object holds the same data.
+    """
+
+    preferred_class: Type[Serializable[DeserializedBase]]
+    alias_index: AliasIndex
+
+    def _unpack(self, hash_str: str) -> Tuple[Serializable[DeserializedBase], DeserializedBase]:
+        serialized = self.load(hash_str)
+        return serialized, serialized.unpack(self.fs)
+
+    def _unpack_resolved(self, hash_str: str) -> Tuple[Serializable[DeserializedBase],
+                                                       DeserializedBase]:
+        alias = self.alias_index.get(hash_str)
+        if alias is not None:
+            try:
+                return self._unpack(alias)
+            except Exception:
+                # Fall back to the original hash, which is no worse than not transcoding at all
+                logger.warning(f'Failed to open alias {alias} of {hash_str}', exc_info=True)
+        return self._unpack(hash_str)
+
+    def _transcode(self, hash_str: str, deserialized: DeserializedBase) -> None:
+        """Best-effort re-pack of `deserialized` with `preferred_class`. The alias is only
+        recorded once the re-packed object has been loaded back and found equal to the original.
+        """
+        try:
+            transcoded_addr = self.preferred_class.dump(deserialized, self.fs)
+            transcoded, transcoded_deserialized = self._unpack(transcoded_addr.id)
+            try:
+                lossless = self.preferred_class.equals(deserialized, transcoded_deserialized)
+            finally:
+                transcoded.close(transcoded_deserialized)
+            if not lossless:
+                logger.warning(f'Not transcoding {hash_str} to {self.preferred_class.__name__}, '
+                               'which does not preserve its data')
+                return
+            self.alias_index.set(hash_str, transcoded_addr.id)
+        except Exception:
+            logger.warning(f'Failed to transcode {hash_str} to {self.preferred_class.__name__}',
+                           exc_info=True)
+
+    @contextlib.contextmanager
+    def open(self, hash_str: str) -> Generator[DeserializedBase, None, None]:
+        serialized, deserialized = self._unpack_resolved(hash_str)
+        try:
+            if not isinstance(serialized, self.preferred_class):
+                self._transcode(hash_str, deserialized)
+            yield deserialized
+        finally:
+            serialized.close(deserialized)
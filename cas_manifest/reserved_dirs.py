@@ -0,0 +1,25 @@
+"""Directories inside a HashFS root that hold bookkeeping rather than objects.
+
+Shard directories are named with hex digits, so reserved directories are named with a
+leading `.` to never collide with them.
+"""
+import os
+from pathlib import Path
+from typing import Iterator
+
+from hashfs import HashFS
+
+
+def reserved_dir(root: str, name: str) -> Path:
+    return Path(root) / f'.{name}'
+
+
+def is_reserved(root: str, path: str) -> bool:
+    return os.path.relpath(path, root).startswith('.')
+
+
+def object_files(fs: HashFS) -> Iterator[str]:
+    """Return generator that yields the files in `fs` that are objects, skipping
+    reserved directories.
+    """
+    return (path for path in HashFS.files(fs) if not is_reserved(fs.root, path))
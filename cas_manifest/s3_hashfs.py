@@ -1,13 +1,24 @@
+import hashlib
 from io import StringIO, BytesIO
+import logging
+import os
 from pathlib import Path
 import re
-from typing import Optional, Union
+import tempfile
+from typing import Iterator, Optional, Union
 
 from botocore.client import BaseClient
-from botocore.exceptions import ClientError
+from botocore.exceptions import (ClientError, ConnectionError, IncompleteReadError,
+                                 ReadTimeoutError)
 from hashfs import HashFS, HashAddress
 from pydantic.dataclasses import dataclass
 
+from .reserved_dirs import object_files, reserved_dir
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 @dataclass
 class S3CasInfo:
@@ -50,11 +61,14 @@ def normalize_extension(extension: Optional[str]) -> str:
 
 class S3HashFS(HashFS):
 
-    def __init__(self, local_path: Path, s3_conn: BaseClient, s3_cas_info: S3CasInfo):
+    def __init__(self, local_path: Path, s3_conn: BaseClient, s3_cas_info: S3CasInfo,
+                 download_attempts: int = 3):
         super().__init__(local_path, depth=1, width=2)
         self.local_path = local_path
         self.s3_conn = s3_conn
         self.s3_cas_info = s3_cas_info
+        self.download_attempts = download_attempts
+        self.staging_path = reserved_dir(self.root, 'staging')
 
     def _make_s3_path(self, hash_str: str, extension: str = None) -> str:
         sharded_path = super().shard(hash_str)
@@ -92,9 +106,46 @@ class S3HashFS(HashFS):
             expected_local_path = Path(super().idpath(file, extension=key_extension))
             expected_local_path.parent.mkdir(parents=True, exist_ok=True)
 
-            self.s3_conn.download_file(self.s3_cas_info.bucket, key, str(expected_local_path))
+            for _ in range(self.download_attempts):
+                if self._download_verified(file, key, expected_local_path):
+                    break
+            else:
+                raise IOError(f"Failed to download after {self.download_attempts} attempts: {file}")
         return super().get(file)
 
+    def _download_verified(self, file, key: str, local_path: Path) -> bool:
+        """Download `key` to `local_path`, hashing the bytes as they arrive.
+        The object is only moved into place if its hash matches `file`; returns whether it did.
+        Truncated or interrupted downloads count as failed attempts, like hash mismatches.
+        """
+        hashobj = hashlib.new(self.algorithm)
+        # Stage the download in a reserved directory of the HashFS root, so that partial files
+        # are never listed by `files()`, but the final rename stays on the same filesystem
+        self.staging_path.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.staging_path)
+        try:
+            with os.fdopen(fd, mode='wb') as f:
+                try:
+                    response = self.s3_conn.get_object(Bucket=self.s3_cas_info.bucket, Key=key)
+                    for chunk in response['Body'].iter_chunks(DOWNLOAD_CHUNK_SIZE):
+                        hashobj.update(chunk)
+                        f.write(chunk)
+                except (IncompleteReadError, ReadTimeoutError, ConnectionError):
+                    logger.warning(f'Interrupted download of {key}', exc_info=True)
+                    return False
+            if hashobj.hexdigest() != file:
+                logger.warning(f'Hash mismatch downloading {key}')
+                return False
+            os.chmod(tmp_path, self.fmode)
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def files(self) -> Iterator[str]:
+        return object_files(self)
+
     def open(self, file, mode='rb') -> Union[StringIO, BytesIO]:
         # First, call `get` to ensure that we have a local copy, then `open` from super
         hash_addr = self.get(file)
@@ -103,13 +154,22 @@ class S3HashFS(HashFS):
         else:
             return super().open(hash_addr.id, mode=mode)
 
+    def push(self, file, extension=None) -> bool:
+        """Upload a locally cached object to s3, unless the remote store already has it.
+        Returns True if the object was uploaded.
+        """
+        s3_key = self._make_s3_path(file, extension=extension)
+        local_path = super().realpath(file)
+        # See if the remote store has the object
+        if self._check_remote_key_exists(s3_key):
+            return False
+        # and if not, upload it
+        self.s3_conn.upload_file(local_path, self.s3_cas_info.bucket, s3_key)
+        return True
+
     def put(self, file, extension=None) -> HashAddress:
         # First put the file in the local cache, from which we'll get its hash addr
         hash_addr = super().put(file, extension=extension)
-        s3_key = self._make_s3_path(hash_addr.id, extension=extension)
-        local_path = super().realpath(hash_addr.id)
-        # Now, see if the remote store has the object
-        if not self._check_remote_key_exists(s3_key):
-            # and if not, upload it
-            self.s3_conn.upload_file(local_path, self.s3_cas_info.bucket, s3_key)
+        # Now, make sure that the remote store has the object
+        self.push(hash_addr.id, extension=extension)
         return hash_addr
@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from io import BytesIO, TextIOWrapper
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import IO, Iterator, List, Optional, Set, Union
+
+from hashfs import HashFS, HashAddress
+
+from .reserved_dirs import object_files, reserved_dir
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """Thread-safe LRU cache of object contents, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes: int, max_object_size: int):
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size
+        self.nbytes = 0
+        self._contents: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, hash_str: str) -> Optional[bytes]:
+        with self._lock:
+            contents = self._contents.get(hash_str)
+            if contents is not None:
+                self._contents.move_to_end(hash_str)
+            return contents
+
+    def put(self, hash_str: str, contents: bytes) -> None:
+        if len(contents) > self.max_object_size:
+            return
+        with self._lock:
+            if hash_str in self._contents:
+                self._contents.move_to_end(hash_str)
+                return
+            self._contents[hash_str] = contents
+            self.nbytes += len(contents)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._contents.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+
+class TieredHashFS(HashFS):
+    """HashFS backed by a chain of stores, fastest first.
+
+    Small objects are kept in an in-process memory cache, in front of the local disk at
+    `local_path`. Objects missing locally are looked up in each of `remotes` in order (for
+    example a shared regional store, then an origin `S3HashFS`), and promoted into the local
+    disk and, on a best-effort basis, any remotes in front of the one they were found in.
+
+    An `S3HashFS` remote keeps its own local cache, so it should be given the same
+    `local_path` as this store. It then downloads straight into the local disk, and neither
+    reads nor writes make a second local copy of each object.
+
+    Writes always go to local disk. With `write_back=False` they are also written through to
+    every remote before `put` returns; with `write_back=True` they are queued until `flush`,
+    which is also called when the store is used as a context manager. The queue is kept in a
+    reserved directory of the local disk, so objects queued by a process that exits without
+    flushing are written by the next `flush` on the same local disk.
+    """
+
+    def __init__(self, local_path: Path, remotes: List[HashFS], write_back: bool = False,
+                 memory_max_bytes: int = 64 * 1024 * 1024,
+                 memory_max_object_size: int = 1024 * 1024):
+        super().__init__(local_path, depth=1, width=2)
+        self.local_path = local_path
+        self.remotes = remotes
+        self.write_back = write_back
+        self.memory = MemoryCache(memory_max_bytes, memory_max_object_size)
+        self.pending_path = reserved_dir(self.root, 'pending')
+
+    def _promote(self, addr: HashAddress, remotes: List[HashFS], best_effort: bool = False) -> None:
+        extension = os.path.splitext(addr.abspath)[1] or None
+        if not super().exists(addr.id):
+            super().put(addr.abspath, extension=extension)
+        for remote in remotes:
+            try:
+                remote.put(addr.abspath, extension=extension)
+            except Exception:
+                if not best_effort:
+                    raise
+                logger.warning(f'Failed to promote {addr.id} into {remote.root}', exc_info=True)
+
+    def get(self, file) -> Optional[HashAddress]:
+        if not super().exists(file):
+            for i, remote in enumerate(self.remotes):
+                remote_addr = remote.get(file)
+                if remote_addr is not None:
+                    # The object is already fetched, so a nearer remote being down is no reason
+                    # to fail
+                    self._promote(remote_addr, self.remotes[:i], best_effort=True)
+                    break
+            else:
+                # Not found in any tier, return `None` to conform to HashFS api
+                return None
+        return super().get(file)
+
+    def open(self, file, mode='rb') -> Union[BytesIO, IO]:
+        contents = self.memory.get(file)
+        if contents is None:
+            hash_addr = self.get(file)
+            if hash_addr is None:
+                raise IOError(f"Not found: {file}")
+            if os.path.getsize(hash_addr.abspath) > self.memory.max_object_size:
+                # Too big to cache, so read straight from local disk
+                return super().open(hash_addr.id, mode=mode)
+            with super().open(hash_addr.id, mode='rb') as f:
+                contents = f.read()
+            self.memory.put(hash_addr.id, contents)
+        if 'b' in mode:
+            return BytesIO(contents)
+        else:
+            # Decode as `open` would, with the locale encoding and universal newlines
+            return TextIOWrapper(BytesIO(contents))
+
+    def put(self, file, extension=None) -> HashAddress:
+        hash_addr = super().put(file, extension=extension)
+        if self.write_back:
+            self.pending_path.mkdir(parents=True, exist_ok=True)
+            (self.pending_path / hash_addr.id).touch()
+        else:
+            self._promote(hash_addr, self.remotes)
+        return hash_addr
+
+    def files(self) -> Iterator[str]:
+        return object_files(self)
+
+    @property
+    def pending(self) -> Set[str]:
+        """Hashes queued by write-back `put`s that have not yet been flushed."""
+        if not self.pending_path.exists():
+            return set()
+        return set(os.listdir(self.pending_path))
+
+    def flush(self) -> None:
+        """Write all objects queued by write-back `put`s through to the remotes."""
+        for hash_str in self.pending:
+            hash_addr = super().get(hash_str)
+            if hash_addr is None:
+                logger.warning(f'Dropping {hash_str} from write-back queue, '
+                               'it is missing from local disk')
+            else:
+                self._promote(hash_addr, self.remotes)
+            # Only dequeue once written, so that a failed flush can be retried
+            try:
+                (self.pending_path / hash_str).unlink()
+            except FileNotFoundError:
+                # Already flushed by another process sharing this local disk
+                pass
+
+    def __enter__(self) -> 'TieredHashFS':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.flush()
@@ -1,13 +1,21 @@
 from io import BytesIO
+import os
+from pathlib import Path
 import tempfile
 import zipfile
 
+import boto3
 from hashfs import HashFS
+from moto import mock_s3
 import pytest
+
+from cas_manifest.s3_hashfs import S3HashFS, S3CasInfo
 """
 Shared pytest fixtures
 """
 
+BUCKET = 'facet-models-test'
+
 
 @pytest.fixture(scope='module')
 def fs_instance():
@@ -24,3 +32,30 @@ def zip_addr(fs_instance):
     zf.close()
     buf.seek(0)
     return fs_instance.put(buf)
+
+
+@pytest.fixture(scope='function')
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+
+
+@pytest.fixture(scope='function')
+def s3(aws_credentials):
+    with mock_s3():
+        yield boto3.client('s3', region_name='us-east-1')
+
+
+@pytest.fixture
+def s3_conn(s3):
+    s3.create_bucket(Bucket=BUCKET)
+    yield s3
+
+
+@pytest.fixture
+def fs(s3_conn, tmpdir):
+    cas_info = S3CasInfo(BUCKET, 'cas')
+    yield S3HashFS(Path(tmpdir), s3_conn, cas_info)
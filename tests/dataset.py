@@ -76,6 +76,10 @@ class NPYSerializable(Serializable[pd.DataFrame]):
         arr = np.load(addr.abspath)
         return pd.DataFrame(arr, columns=self.column_names)
 
+    @classmethod
+    def equals(cls, inst: pd.DataFrame, other: pd.DataFrame) -> bool:
+        return inst.equals(other)
+
 
 class ZipDataset(Dataset):
 
@@ -1,4 +1,6 @@
+from io import StringIO
 from pathlib import Path
+from mock import patch
 
 from .dataset import ZipSerializable, CSVSerializable, NPYSerializable
 from .opaque_example import OpaqueObject, OpaqueSerializable
@@ -7,7 +9,8 @@ import pandas as pd
 
 
 from cas_manifest.ref import Ref
-from cas_manifest.registry import SerializableRegistry
+from cas_manifest.alias_index import AliasIndex
+from cas_manifest.registry import SerializableRegistry, TranscodingRegistry
 
 
 def test_serde(fs_instance):
@@ -85,3 +88,57 @@ def test_pd_registry(fs_instance):
     # load the model
     with registry_2.open(npy_addr.id) as npy_df:
         pd.testing.assert_frame_equal(df, npy_df)
+
+
+def test_transcoding_registry(fs_instance, tmp_path):
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': [4, 5, 6]})
+    csv_addr = CSVSerializable.dump(df, fs_instance)
+    alias_index = AliasIndex(tmp_path / 'aliases')
+    registry: TranscodingRegistry[pd.DataFrame] = \
+        TranscodingRegistry(fs=fs_instance, classes=[CSVSerializable, NPYSerializable],
+                            preferred_class=NPYSerializable, alias_index=alias_index)
+    # The first open reads the csv, and records an alias to the re-packed npy form
+    with registry.open(csv_addr.id) as df_2:
+        pd.testing.assert_frame_equal(df, df_2)
+    npy_hash = alias_index.get(csv_addr.id)
+    assert isinstance(registry.load(npy_hash), NPYSerializable)
+
+    # Later opens of the old hash go through the npy form
+    with patch.object(CSVSerializable, 'unpack') as mock_unpack:
+        with registry.open(csv_addr.id) as df_3:
+            pd.testing.assert_frame_equal(df, df_3)
+        mock_unpack.assert_not_called()
+
+
+def test_transcoding_registry_unrepresentable(fs_instance, tmp_path):
+    # NPYSerializable cannot load back object arrays, so this frame cannot be transcoded
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+    csv_addr = CSVSerializable.dump(df, fs_instance)
+    alias_index = AliasIndex(tmp_path / 'aliases')
+    registry: TranscodingRegistry[pd.DataFrame] = \
+        TranscodingRegistry(fs=fs_instance, classes=[CSVSerializable, NPYSerializable],
+                            preferred_class=NPYSerializable, alias_index=alias_index)
+    for _ in range(2):
+        with registry.open(csv_addr.id) as df_2:
+            pd.testing.assert_frame_equal(df, df_2)
+    assert alias_index.get(csv_addr.id) is None
+
+    # An alias that cannot be loaded is bypassed in favor of the original hash
+    bad_addr = fs_instance.put(StringIO('{"not": "a manifest"}'))
+    alias_index.set(csv_addr.id, bad_addr.id)
+    with registry.open(csv_addr.id) as df_3:
+        pd.testing.assert_frame_equal(df, df_3)
+
+
+def test_transcoding_registry_lossy(fs_instance, tmp_path):
+    # NPYSerializable stores a single array, so mixed dtypes would all come back as floats
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': [4.5, 5.5, 6.5]})
+    csv_addr = CSVSerializable.dump(df, fs_instance)
+    alias_index = AliasIndex(tmp_path / 'aliases')
+    registry: TranscodingRegistry[pd.DataFrame] = \
+        TranscodingRegistry(fs=fs_instance, classes=[CSVSerializable, NPYSerializable],
+                            preferred_class=NPYSerializable, alias_index=alias_index)
+    for _ in range(2):
+        with registry.open(csv_addr.id) as df_2:
+            pd.testing.assert_frame_equal(df, df_2)
+    assert alias_index.get(csv_addr.id) is None
@@ -0,0 +1,33 @@
+from mock import patch
+import pytest
+
+from cas_manifest.alias_index import AliasIndex
+
+HASH = '32c220482c68413fbf8290e3b1e49b0a85901cfcd62ab0738760568a2a6e8a57'
+ALIAS = 'a1b2c3'
+
+
+def test_alias_index(tmp_path):
+    alias_index = AliasIndex(tmp_path)
+    assert alias_index.get(HASH) is None
+    alias_index.set(HASH, ALIAS)
+    assert alias_index.get(HASH) == ALIAS
+
+
+def test_rejects_non_hashes(tmp_path):
+    alias_index = AliasIndex(tmp_path / 'aliases')
+    with pytest.raises(ValueError, match='Not a hash'):
+        alias_index.set('../../x', ALIAS)
+    with pytest.raises(ValueError, match='Not a hash'):
+        alias_index.set(HASH, '../x')
+    assert alias_index.get('../../x') is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_set_leaves_no_temp_file(tmp_path):
+    alias_index = AliasIndex(tmp_path)
+    with patch('os.replace', side_effect=OSError('boom')):
+        with pytest.raises(OSError):
+            alias_index.set(HASH, ALIAS)
+    assert [p.name for p in tmp_path.iterdir()] == [HASH[:2]]
+    assert list((tmp_path / HASH[:2]).iterdir()) == []
@@ -0,0 +1,123 @@
+from io import StringIO
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+from mock import patch
+import pytest
+
+from cas_manifest.cli import Progress, find_refs, main, sync, verify, warm
+from cas_manifest.ref import Ref
+from cas_manifest.s3_hashfs import S3HashFS
+
+from .dataset import CSVSerializable
+from .conftest import BUCKET
+
+
+def test_find_refs(fs_instance):
+    data_addr = fs_instance.put(StringIO('a,b\n1,2\n'))
+    manifest = CSVSerializable(path=Ref(data_addr), column_names=['a', 'b'])
+    manifest_addr = manifest.self_dump(fs_instance)
+    assert find_refs(manifest_addr.abspath) == {data_addr.id}
+    # Data files are not manifests, and reference nothing
+    assert find_refs(data_addr.abspath) == set()
+    # Files above the size cap are not parsed at all
+    assert find_refs(manifest_addr.abspath, max_size=10) == set()
+
+
+def test_warm(fs, s3_conn, tmp_path):
+    data_addr = fs.put(StringIO('a,b\n1,2\n'))
+    manifest = CSVSerializable(path=Ref(data_addr), column_names=['a', 'b'])
+    manifest_addr = manifest.self_dump(fs)
+
+    # A separate local cache from `fs`, which is rooted at tmp_path
+    fs2 = S3HashFS(tmp_path / 'warm', s3_conn, fs.s3_cas_info)
+    assert not fs2.exists(manifest_addr.id)
+    assert not fs2.exists(data_addr.id)
+    missing, failed = warm(fs2, [manifest_addr.id, 'asdf'], parallelism=2)
+    assert missing == ['asdf']
+    assert failed == []
+    # Both the manifest and the data it references are now cached locally
+    assert fs2.exists(manifest_addr.id)
+    assert fs2.exists(data_addr.id)
+
+
+def test_sync(fs, s3_conn, tmp_path):
+    fs2 = S3HashFS(tmp_path / 'sync', s3_conn, fs.s3_cas_info)
+    # Put into the local cache only, bypassing the upload
+    addr = super(S3HashFS, fs2).put(StringIO('DFDFDF'), extension='txt')
+    assert sync(fs2, parallelism=2) == (1, [])
+    # Everything is uploaded now, so a second sync is a no-op
+    assert sync(fs2, parallelism=2) == (0, [])
+
+    assert not fs.exists(addr.id)
+    assert fs.get(addr.id) is not None
+
+
+def test_verify(fs_instance):
+    good_addr = fs_instance.put(StringIO('good'))
+    bad_addr = fs_instance.put(StringIO('bad'))
+    Path(bad_addr.abspath).write_text('corrupted')
+
+    assert verify(fs_instance, parallelism=2) == ([bad_addr.abspath], [])
+    assert verify(fs_instance, parallelism=2, remove=True) == ([bad_addr.abspath], [])
+    assert not fs_instance.exists(bad_addr.id)
+    assert fs_instance.exists(good_addr.id)
+    assert verify(fs_instance, parallelism=2) == ([], [])
+
+
+def test_main(fs, s3_conn, tmp_path):
+    addr = fs.put(StringIO('DFDFDF'))
+    local_path = str(fs.local_path)
+    assert main(['--local-path', local_path, 'verify']) == 0
+    assert main(['--local-path', local_path, '--bucket', BUCKET, 'sync']) == 0
+    warm_path = tmp_path / 'warm'
+    assert main(['--local-path', str(warm_path), '--bucket', BUCKET, 'warm', addr.id]) == 0
+    assert S3HashFS(warm_path, s3_conn, fs.s3_cas_info).exists(addr.id)
+    assert main(['--local-path', local_path, 'sync']) == 2
+
+
+def test_progress_throttled():
+    out = StringIO()
+    progress = Progress('test', total=1000, out=out, interval=60)
+    for _ in range(1000):
+        progress.update(10)
+    progress.finish()
+    # Only the final summary is written within the interval
+    assert out.getvalue().count('\n') == 1
+    assert out.getvalue().startswith('test: 1000/1000 objects')
+
+
+def test_main_hashes_from_stdin(fs, s3_conn, monkeypatch, tmp_path):
+    addr = fs.put(StringIO('DFDFDF'))
+    stdin = StringIO(f'{addr.id}\n\n')
+    monkeypatch.setattr('sys.stdin', stdin)
+    warm_path = str(tmp_path / 'warm')
+    assert main(['--local-path', warm_path, '--bucket', BUCKET, 'warm', '--hash-file', '-']) == 0
+    assert not stdin.closed
+
+
+def test_failures_do_not_abort(fs, s3_conn, tmp_path):
+    addrs = [fs.put(StringIO(contents)) for contents in ('DF', 'DFDF')]
+    fs2 = S3HashFS(tmp_path / 'warm', s3_conn, fs.s3_cas_info)
+    real_get = fs2.get
+
+    def fail_first(hash_str):
+        if hash_str == addrs[0].id:
+            raise IOError('boom')
+        return real_get(hash_str)
+
+    with patch.object(fs2, 'get', side_effect=fail_first):
+        missing, failed = warm(fs2, [addr.id for addr in addrs], parallelism=2)
+    assert (missing, failed) == ([], [addrs[0].id])
+    assert fs2.exists(addrs[1].id)
+
+    error = ClientError({'Error': {'Code': '500'}}, 'PutObject')
+    fs3 = S3HashFS(tmp_path / 'sync', s3_conn, fs.s3_cas_info)
+    local_addr = super(S3HashFS, fs3).put(StringIO('DFDFDF'))
+    with patch.object(fs3, 'push', side_effect=error):
+        assert sync(fs3, parallelism=2) == (0, [local_addr.id])
+
+
+def test_main_rejects_parallelism():
+    with pytest.raises(SystemExit):
+        main(['--local-path', '.', '-j', '0', 'verify'])
@@ -1,43 +1,12 @@
-from io import StringIO
-import os
+from io import BytesIO, StringIO
 from mock import patch
 from pathlib import Path
 import tempfile
 
-import boto3
-from moto import mock_s3
+from botocore.response import StreamingBody
 import pytest
 
-from cas_manifest.s3_hashfs import S3HashFS, S3CasInfo, get_extension
-
-BUCKET = 'facet-models-test'
-
-
-@pytest.fixture(scope='function')
-def aws_credentials():
-    """Mocked AWS Credentials for moto."""
-    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
-    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
-    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
-    os.environ['AWS_SESSION_TOKEN'] = 'testing'
-
-
-@pytest.fixture(scope='function')
-def s3(aws_credentials):
-    with mock_s3():
-        yield boto3.client('s3', region_name='us-east-1')
-
-
-@pytest.fixture
-def s3_conn(s3):
-    s3.create_bucket(Bucket=BUCKET)
-    yield s3
-
-
-@pytest.fixture
-def fs(s3_conn, tmpdir):
-    cas_info = S3CasInfo(BUCKET, 'cas')
-    yield S3HashFS(Path(tmpdir), s3_conn, cas_info)
+from cas_manifest.s3_hashfs import S3HashFS, get_extension
 
 
 def test_s3_hashfs(fs, s3_conn):
@@ -105,3 +74,82 @@ def test_subdirs(fs, s3_conn):
         fs2 = S3HashFS(Path(tmpdir2) / 'my_subdir', s3_conn, fs.s3_cas_info)
         retrieved2 = fs2.open(addr.id, mode='r').read()
         assert(retrieved2 == contents)
+
+
+def test_corrupt_download_retried(fs, s3_conn):
+    contents = "DFDFDF"
+    buf = StringIO(contents)
+    buf.seek(0)
+    addr = fs.put(buf)
+    Path(addr.abspath).unlink()
+
+    real_get_object = s3_conn.get_object
+    responses = []
+
+    def corrupt_first_get_object(**kwargs):
+        response = real_get_object(**kwargs)
+        if not responses:
+            response['Body'] = StreamingBody(BytesIO(b'corrupted'), len(b'corrupted'))
+        responses.append(response)
+        return response
+
+    with patch.object(s3_conn, 'get_object', side_effect=corrupt_first_get_object):
+        retrieved = fs.open(addr.id, mode='r').read()
+    assert(retrieved == contents)
+    assert(len(responses) == 2)
+
+
+def test_corrupt_download_not_cached(fs, s3_conn):
+    contents = "DFDFDF"
+    buf = StringIO(contents)
+    buf.seek(0)
+    addr = fs.put(buf)
+    Path(addr.abspath).unlink()
+
+    def corrupt_get_object(**kwargs):
+        return {'Body': StreamingBody(BytesIO(b'corrupted'), len(b'corrupted'))}
+
+    with patch.object(s3_conn, 'get_object', side_effect=corrupt_get_object) as mock_get:
+        with pytest.raises(IOError, match='Failed to download'):
+            fs.get(addr.id)
+        assert(mock_get.call_count == fs.download_attempts)
+    # Neither the corrupt bytes nor any temporary files are left in the cache
+    assert(list(fs.files()) == [])
+    assert(list(fs.staging_path.iterdir()) == [])
+
+
+def test_truncated_download_retried(fs, s3_conn):
+    contents = "DFDFDF"
+    buf = StringIO(contents)
+    buf.seek(0)
+    addr = fs.put(buf)
+    Path(addr.abspath).unlink()
+
+    real_get_object = s3_conn.get_object
+    responses = []
+
+    def truncate_first_get_object(**kwargs):
+        response = real_get_object(**kwargs)
+        if not responses:
+            # Fewer bytes than the declared content length
+            response['Body'] = StreamingBody(BytesIO(b'DFD'), len(contents))
+        responses.append(response)
+        return response
+
+    with patch.object(s3_conn, 'get_object', side_effect=truncate_first_get_object):
+        retrieved = fs.open(addr.id, mode='r').read()
+    assert(retrieved == contents)
+    assert(len(responses) == 2)
+
+
+def test_staging_not_listed(fs):
+    contents = "DFDFDF"
+    buf = StringIO(contents)
+    buf.seek(0)
+    addr = fs.put(buf)
+    # Staging lives inside the local cache, so renames never cross filesystems
+    assert(fs.staging_path.parent == Path(fs.root))
+    fs.staging_path.mkdir(parents=True, exist_ok=True)
+    (fs.staging_path / 'tmp_partial').write_text('DF')
+    assert(list(fs.files()) == [addr.abspath])
+    assert(fs.count() == 1)
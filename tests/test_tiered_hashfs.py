@@ -0,0 +1,154 @@
+from io import StringIO
+from mock import patch
+from pathlib import Path
+
+from hashfs import HashFS
+import pandas as pd
+import pytest
+
+from cas_manifest.registry import SerializableRegistry
+from cas_manifest.s3_hashfs import S3HashFS, S3CasInfo
+from cas_manifest.tiered_hashfs import MemoryCache, TieredHashFS
+
+from .conftest import BUCKET
+from .dataset import CSVSerializable
+
+
+@pytest.fixture
+def regional(tmp_path):
+    return HashFS(tmp_path / 'regional', depth=1, width=2)
+
+
+@pytest.fixture
+def origin(tmp_path, s3_conn):
+    # Every tier gets its own sibling directory, so that no tier's objects are visible in another
+    return S3HashFS(tmp_path / 'origin', s3_conn, S3CasInfo(BUCKET, 'cas'))
+
+
+@pytest.fixture
+def tiered(tmp_path, regional, origin):
+    return TieredHashFS(tmp_path / 'local', [regional, origin])
+
+
+def test_write_through(tiered, regional, origin):
+    addr = tiered.put(StringIO('DFDFDF'), extension='txt')
+    assert [regional.unshard(path) for path in regional.files()] == [addr.id]
+    assert [origin.unshard(path) for path in origin.files()] == [addr.id]
+    assert tiered.pending == set()
+
+
+def test_write_back(tiered, regional, origin):
+    tiered.write_back = True
+    addr = tiered.put(StringIO('DFDFDF'))
+    assert not regional.exists(addr.id)
+    assert tiered.pending == {addr.id}
+    tiered.flush()
+    assert regional.exists(addr.id)
+    assert origin.exists(addr.id)
+    assert tiered.pending == set()
+
+
+def test_write_back_survives_restart(tmp_path, regional, origin):
+    tiered = TieredHashFS(tmp_path / 'local', [regional, origin], write_back=True)
+    addr = tiered.put(StringIO('DFDFDF'))
+    # A new instance on the same local disk picks up the unflushed queue
+    with TieredHashFS(tmp_path / 'local', [regional, origin], write_back=True) as tiered_2:
+        assert tiered_2.pending == {addr.id}
+    assert regional.exists(addr.id)
+    assert tiered.pending == set()
+    # The queue is kept in a reserved directory, so it is not mistaken for an object
+    assert list(tiered.files()) == [addr.abspath]
+
+
+def test_write_back_missing_locally(tiered, regional):
+    tiered.write_back = True
+    addr = tiered.put(StringIO('DFDFDF'))
+    Path(addr.abspath).unlink()
+    tiered.flush()
+    assert tiered.pending == set()
+    assert not regional.exists(addr.id)
+
+
+def test_promotion(tmp_path, regional, origin):
+    addr = origin.put(StringIO('DFDFDF'), extension='txt')
+    tiered = TieredHashFS(tmp_path / 'local', [regional, origin])
+    # Found in the origin, and promoted into local disk and the regional store
+    assert tiered.open(addr.id, mode='r').read() == 'DFDFDF'
+    assert regional.exists(addr.id)
+    local_addr = tiered.get(addr.id)
+    assert Path(local_addr.abspath).suffix == '.txt'
+    assert list(tiered.files()) == [local_addr.abspath]
+    assert list(regional.files()) == [regional.get(addr.id).abspath]
+
+    # A fresh local disk is now filled from the regional store, without going to the origin
+    tiered_2 = TieredHashFS(tmp_path / 'local_2', [regional, origin])
+    with patch.object(origin, 'get') as mock_get:
+        assert tiered_2.open(addr.id, mode='r').read() == 'DFDFDF'
+        mock_get.assert_not_called()
+
+
+def test_missing(tiered):
+    assert tiered.get('asdf') is None
+    with pytest.raises(IOError):
+        tiered.open('asdf')
+
+
+def test_registry_memory_hit(tiered):
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': [4, 5, 6]})
+    addr = CSVSerializable.dump(df, tiered)
+    registry: SerializableRegistry[pd.DataFrame] = \
+        SerializableRegistry(fs=tiered, classes=[CSVSerializable])
+    registry.load(addr.id)
+    # The manifest is now served from memory, even without a copy on local disk
+    Path(tiered.get(addr.id).abspath).unlink()
+    tiered.remotes = []
+    assert registry.load(addr.id).column_names == ['a', 'b']
+
+
+def test_memory_cache_eviction():
+    cache = MemoryCache(max_bytes=10, max_object_size=6)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    cache.put('big', b'bigbigbig')
+    assert cache.get('big') is None
+    # Touch `a` so that `b` is the least recently used
+    assert cache.get('a') == b'aaaa'
+    cache.put('c', b'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.nbytes == 8
+
+
+def test_large_objects_not_read_into_memory(tmp_path, regional, origin):
+    tiered = TieredHashFS(tmp_path / 'local', [regional, origin], memory_max_object_size=4)
+    addr = tiered.put(StringIO('DFDFDF'))
+    with tiered.open(addr.id) as f:
+        # A file on local disk, rather than an in-memory buffer
+        assert f.name == addr.abspath
+        assert f.read() == b'DFDFDF'
+    assert tiered.memory.get(addr.id) is None
+
+
+def test_promotion_best_effort(tiered, regional, origin):
+    addr = origin.put(StringIO('DFDFDF'))
+    # The regional store being down does not stop reads from the origin
+    with patch.object(regional, 'put', side_effect=IOError('boom')):
+        assert tiered.open(addr.id, mode='r').read() == 'DFDFDF'
+    assert tiered.exists(addr.id)
+    assert not regional.exists(addr.id)
+
+
+def test_shared_local_path(tmp_path, regional, origin, s3_conn):
+    addr = origin.put(StringIO('DFDFDF'))
+    # An S3 tier sharing the local disk downloads straight into it
+    shared_origin = S3HashFS(tmp_path / 'local', s3_conn, origin.s3_cas_info)
+    tiered = TieredHashFS(tmp_path / 'local', [regional, shared_origin])
+    assert tiered.open(addr.id, mode='r').read() == 'DFDFDF'
+    local_addr = tiered.get(addr.id)
+    assert list(tiered.files()) == [local_addr.abspath]
+    assert list(shared_origin.files()) == [local_addr.abspath]
+
+    written = tiered.put(StringIO('FDFDFD'))
+    assert sorted(tiered.files()) == sorted([local_addr.abspath, written.abspath])
+    # and write-through still reaches s3
+    assert origin.get(written.id) is not None